@@ -12,6 +12,8 @@
 from __future__ import print_function
 
 import re
+import sre_constants
+import sre_parse
 import sys
 import time
 
@@ -35,6 +37,10 @@ _encoding_map = [(b'\xef\xbb\xbf', 'utf-8'),
 
 _default_analyse = staticmethod(lambda x: 0.0)
 
+#: The type of compiled regular expression patterns, for the benefit of
+#: lexers that precompile some of their patterns (see `_process_regex`).
+_pattern_type = type(re.compile(''))
+
 
 class LexerMeta(type):
     """
@@ -424,6 +430,11 @@ class RegexLexerMeta(LexerMeta):
         """Preprocess the regular expression component of a token definition."""
         if isinstance(regex, Future):
             regex = regex.get()
+        if isinstance(regex, _pattern_type):
+            # the pattern was precompiled by the lexer (its flags take
+            # precedence over *rflags*); this lets expensive patterns be
+            # compiled once at module level and shared between lexers
+            return regex.match
         return re.compile(regex, rflags).match
 
     def _process_token(cls, token):
@@ -630,10 +641,20 @@ class RegexLexer(Lexer):
                     if action is not None:
                         if type(action) is _TokenType:
                             yield pos, action, m.group()
+                            pos = m.end()
                         else:
+                            # callbacks may scan ahead and yield tokens
+                            # reaching beyond the end of the match (see
+                            # FastDispatchRegexLexer); continue after the
+                            # last token yielded
+                            pos = m.end()
                             for item in action(self, m):
                                 yield item
-                    pos = m.end()
+                                end = item[0] + len(item[2])
+                                if end > pos:
+                                    pos = end
+                    else:
+                        pos = m.end()
                     if new_state is not None:
                         # state transition
                         if isinstance(new_state, tuple):
@@ -670,6 +691,242 @@ class RegexLexer(Lexer):
                     break
 
 
+def _in_first_chars(av):
+    """Return the set of character codes matched by an IN item, or None."""
+    chars = set()
+    for op, a in av:
+        if op is sre_constants.LITERAL:
+            chars.add(a)
+        elif op is sre_constants.RANGE:
+            lo, hi = a
+            if hi - lo > 255:
+                return None
+            chars.update(range(lo, hi + 1))
+        else:
+            # negations and categories are not worth enumerating
+            return None
+    return chars
+
+
+def _item_first_chars(item):
+    """Return (chars, nullable) for one parsed pattern item."""
+    op, av = item
+    if op is sre_constants.AT or op is sre_constants.ASSERT or \
+       op is sre_constants.ASSERT_NOT:
+        # zero-width; over-approximate by ignoring the assertion
+        return set(), True
+    if op is sre_constants.LITERAL:
+        return set([av]), False
+    if op is sre_constants.IN:
+        return _in_first_chars(av), False
+    if op is sre_constants.SUBPATTERN:
+        if len(av) == 4 and (av[1] or av[2]):
+            # don't try to reason about scoped inline flags
+            return None, False
+        return _seq_first_chars(av[-1])
+    if op is sre_constants.BRANCH:
+        chars = set()
+        nullable = False
+        for branch in av[1]:
+            c, n = _seq_first_chars(branch)
+            if c is None:
+                return None, False
+            chars.update(c)
+            nullable = nullable or n
+        return chars, nullable
+    if op is sre_constants.MAX_REPEAT or op is sre_constants.MIN_REPEAT:
+        lo, _, sub = av
+        c, n = _seq_first_chars(sub)
+        if c is None:
+            return None, False
+        return c, n or lo == 0
+    return None, False
+
+
+def _seq_first_chars(seq):
+    """Return (chars, nullable) for a parsed pattern sequence.
+
+    *chars* is the set of character codes a match of the sequence can start
+    with (None if undeterminable), *nullable* is true if the sequence can
+    match the empty string.
+    """
+    chars = set()
+    for item in seq:
+        c, nullable = _item_first_chars(item)
+        if c is None:
+            return None, False
+        chars.update(c)
+        if not nullable:
+            return chars, False
+    return chars, True
+
+
+# non-ASCII characters that Unicode case folding maps onto an ASCII
+# letter, so ``(?i)`` patterns starting with that letter accept them too:
+# dotted/dotless I, long s and the Kelvin sign
+_unicode_fold_partners = (
+    (0x69, (0x130, 0x131)),
+    (0x73, (0x17f,)),
+    (0x6b, (0x212a,)),
+)
+
+
+def regex_first_chars(regex):
+    """
+    Return a frozenset of all character codes a match of the compiled
+    pattern *regex* can possibly start with, or ``None`` if they cannot be
+    determined (in which case the pattern must be tried at every position).
+    """
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+        chars, nullable = _seq_first_chars(parsed)
+    except Exception:
+        return None
+    if chars is None or nullable:
+        return None
+    if regex.flags & re.IGNORECASE:
+        folded = set()
+        for c in chars:
+            if c > 127:
+                # no cheap way to enumerate non-ASCII case folds
+                return None
+            folded.add(c)
+            if 65 <= c <= 90:
+                folded.add(c + 32)
+            elif 97 <= c <= 122:
+                folded.add(c - 32)
+        for c, partners in _unicode_fold_partners:
+            if c in folded:
+                folded.update(partners)
+        chars = folded
+    return frozenset(chars)
+
+
+class FastDispatchRegexLexer(RegexLexer):
+    """
+    A `RegexLexer` that speeds up states with many rules by bucketing the
+    rules by the characters a match of each rule can start with.
+
+    Most rules of a typical 'root' state are disjoint on their first
+    character (quotes, digits, sigils, letters...), yet the standard
+    matching loop tries every rule in turn at every position.  This lexer
+    derives, for each rule, the set of possible first characters from the
+    parsed regex and only tries the rules that can match the character at
+    the current position.  Rules whose first characters cannot be
+    determined are kept in every bucket, and relative rule order -- and
+    therefore the produced token stream -- is unchanged.
+
+    In addition, callable actions may yield tokens that extend beyond the
+    end of the triggering match; the position then advances past the last
+    token yielded.  This lets a cheap trigger regex hand over to a callback
+    that scans ahead itself (e.g. with ``str.find``).
+    """
+
+    @classmethod
+    def _dispatch_tables(cls):
+        # the tables must be per-class, not inherited from a base class
+        tables = cls.__dict__.get('_dispatch_cache')
+        if tables is None:
+            tables = ({}, {})  # startsets by state, buckets by (state, char)
+            cls._dispatch_cache = tables
+        return tables
+
+    def _dispatch_bucket(self, statename, key):
+        """Build and cache the rule bucket for bucket key *key* in state
+        *statename*.
+
+        Per-character buckets exist for ASCII only; all other characters
+        share the single bucket keyed u'\\x80', so the cache stays bounded
+        no matter how varied the input.
+        """
+        startsets, buckets = self._dispatch_tables()
+        rules = startsets.get(statename)
+        if rules is None:
+            rules = startsets[statename] = \
+                [(rule, regex_first_chars(rule[0].__self__))
+                 for rule in self._tokens[statename]]
+        if key == u'\x80':
+            bucket = tuple(
+                rule for rule, chars in rules
+                if chars is None or max(chars) > 127)
+        else:
+            code = ord(key)
+            bucket = tuple(
+                rule for rule, chars in rules
+                if chars is None or code in chars)
+        buckets[statename, key] = bucket
+        return bucket
+
+    def get_tokens_unprocessed(self, text, stack=('root',)):
+        """
+        Split ``text`` into (tokentype, text) pairs, only trying the rules
+        that can match the first character at the current position.
+
+        ``stack`` is the inital stack (default: ``['root']``)
+        """
+        pos = 0
+        buckets = self._dispatch_tables()[1]
+        statestack = list(stack)
+        statename = statestack[-1]
+        while 1:
+            try:
+                char = text[pos]
+            except IndexError:
+                break
+            key = char if char < u'\x80' else u'\x80'
+            try:
+                statetokens = buckets[statename, key]
+            except KeyError:
+                statetokens = self._dispatch_bucket(statename, key)
+            for rexmatch, action, new_state in statetokens:
+                m = rexmatch(text, pos)
+                if m:
+                    if action is not None:
+                        if type(action) is _TokenType:
+                            yield pos, action, m.group()
+                            pos = m.end()
+                        else:
+                            pos = m.end()
+                            for item in action(self, m):
+                                yield item
+                                end = item[0] + len(item[2])
+                                if end > pos:
+                                    pos = end
+                    else:
+                        pos = m.end()
+                    if new_state is not None:
+                        # state transition
+                        if isinstance(new_state, tuple):
+                            for state in new_state:
+                                if state == '#pop':
+                                    statestack.pop()
+                                elif state == '#push':
+                                    statestack.append(statestack[-1])
+                                else:
+                                    statestack.append(state)
+                        elif isinstance(new_state, int):
+                            # pop
+                            del statestack[new_state:]
+                        elif new_state == '#push':
+                            statestack.append(statestack[-1])
+                        else:
+                            assert False, "wrong state def: %r" % new_state
+                        statename = statestack[-1]
+                    break
+            else:
+                # We are here only if all state tokens have been considered
+                # and there was not a match on any of them.
+                if char == '\n':
+                    # at EOL, reset state to "root"
+                    statestack = ['root']
+                    statename = 'root'
+                    yield pos, Text, u'\n'
+                    pos += 1
+                    continue
+                yield pos, Error, char
+                pos += 1
+
+
 class LexerContext(object):
     """
     A helper object that holds lexer position data.
@@ -825,9 +1082,15 @@ class ProfilingRegexLexerMeta(RegexLexerMeta):
         if isinstance(regex, words):
             rex = regex_opt(regex.words, prefix=regex.prefix,
                             suffix=regex.suffix)
+        elif isinstance(regex, Future):
+            rex = regex.get()
         else:
             rex = regex
-        compiled = re.compile(rex, rflags)
+        if isinstance(rex, _pattern_type):
+            compiled = rex
+            rex = rex.pattern
+        else:
+            compiled = re.compile(rex, rflags)
 
         def match_func(text, pos, endpos=sys.maxsize):
             info = cls._prof_data[-1].setdefault((state, rex), [0, 0.0])
@@ -27,13 +27,29 @@ __all__ = ['get_lexer_by_name', 'get_lexer_for_filename', 'find_lexer_class',
 _lexer_cache = {}
 _pattern_cache = {}
 
+_plain_suffix_re = re.compile(r'\*(\.[\w+-]+)$')
+
+
+def _suffix_matcher(suffix):
+    """A matcher for plain ``*.ext`` globs: a str.endswith check instead of
+    a regex-based fnmatch."""
+    def match(fn):
+        return fn.endswith(suffix)
+    return match
+
 
 def _fn_matches(fn, glob):
     """Return whether the supplied file name fn matches pattern filename."""
     if glob not in _pattern_cache:
-        pattern = _pattern_cache[glob] = re.compile(fnmatch.translate(glob))
-        return pattern.match(fn)
-    return _pattern_cache[glob].match(fn)
+        m = _plain_suffix_re.match(glob)
+        if m:
+            # the vast majority of filename patterns are plain extensions
+            matcher = _pattern_cache[glob] = _suffix_matcher(m.group(1))
+        else:
+            matcher = _pattern_cache[glob] = \
+                re.compile(fnmatch.translate(glob)).match
+        return matcher(fn)
+    return _pattern_cache[glob](fn)
 
 
 def _load_lexers(module_name):
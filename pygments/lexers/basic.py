@@ -10,16 +10,429 @@
 """
 
 import re
+import hashlib
 
-from pygments.lexer import RegexLexer, bygroups, default, words, include
+from pygments.lexer import RegexLexer, FastDispatchRegexLexer, Future, \
+    bygroups, default, include
 from pygments.token import Text, Comment, Operator, Keyword, Name, String, \
     Number, Punctuation
+from pygments.regexopt import regex_opt
 
 __all__ = ['BlitzBasicLexer', 'BlitzMaxLexer', 'MonkeyLexer', 'CbmBasicV2Lexer',
            'QBasicLexer']
 
 
-class BlitzMaxLexer(RegexLexer):
+# the non-ASCII characters that re.IGNORECASE case-folds onto an ASCII
+# letter: dotted/dotless I, long s and the Kelvin sign
+_ci_fold_extra = {'i': u'İı', 's': u'ſ', 'k': u'K'}
+
+
+def _ci(rex):
+    """Return *rex* with every literal ASCII letter replaced by a class
+    matching both cases.
+
+    Blitz keywords are ASCII-only, so this gives case-insensitive matching
+    without ``re.IGNORECASE``, whose case folding is paid for on every
+    character comparison in the engine.  The classes include the Unicode
+    fold partners of i, s and k, which ``re.IGNORECASE`` accepts too.
+    *rex* must not contain named groups or character classes with ranges.
+    """
+    out = []
+    in_class = False
+    i = 0
+    while i < len(rex):
+        c = rex[i]
+        if c == '\\':
+            out.append(rex[i:i + 2])
+            i += 2
+            continue
+        if c == '[':
+            in_class = True
+            out.append(c)
+        elif c == ']':
+            in_class = False
+            out.append(c)
+        elif 'a' <= c <= 'z' or 'A' <= c <= 'Z':
+            cases = c.lower() + c.upper() + _ci_fold_extra.get(c.lower(), u'')
+            if in_class:
+                out.append(cases)
+            else:
+                out.append(u'[%s]' % cases)
+        else:
+            out.append(c)
+        i += 1
+    return u''.join(out)
+
+
+def _ci_words(strings):
+    """A case-insensitive, case-folded version of `words`."""
+    return _ci(regex_opt(strings, prefix=r'\b', suffix=r'\b'))
+
+
+class _lazy_re(Future):
+    """A `Future` that builds and compiles ``template % args`` on first use.
+
+    This module holds several lexers; deferring the composite Blitz
+    patterns means their long strings are only materialized (once) for
+    lexers that actually lex something, not whenever the module is
+    imported for one of its other lexers.
+    """
+    def __init__(self, template, args, flags=0):
+        self.template = template
+        self.args = args
+        self.flags = flags
+        self._rex = None
+
+    def get(self):
+        if self._rex is None:
+            self._rex = re.compile(self.template % self.args, self.flags)
+        return self._rex
+
+
+# The composite variable/function patterns of the Blitz lexers are expensive
+# to build and compile; share one (lazily compiled) copy at module level so
+# the work is not repeated for every lexer class (and does not thrash the
+# small `re` cache).
+_bmax_vopwords = r'\b(?:%s)\b' % _ci('Shl|Shr|Sar|Mod')
+_bmax_sktypes = r'@{1,2}|[!#$%]'
+_bmax_lktypes = r'\b(%s)\b' % _ci('Int|Byte|Short|Float|Double|Long')
+_bmax_name = u'[A-Za-z_İıſK]\\w*'
+# the type suffix of a variable: sigil, vop shortcut or ':Type', with an
+# optional trailing 'Ptr' (ten groups)
+_bmax_var_suffix = (r'(?:(?:([ \t]*)(%s)|([ \t]*:[ \t]*\b(?:%s)\b)'
+                    r'|([ \t]*)(:)([ \t]*)(?:%s|(%s)))(?:([ \t]*)(%s))?)') % \
+    (_bmax_sktypes, _ci('Shl|Shr|Sar|Mod'), _bmax_lktypes,
+     _bmax_name, _ci('Ptr'))
+
+# Function and variable references share their leading name and type
+# suffix; matching them with one fused regex (function form first, as
+# before) avoids re-matching the name when the '(' is missing.  Group 1 is
+# the name, groups 2-13 the function form, groups 14-23 the variable form.
+_bmax_varfunc_re = _lazy_re(
+    r'(%s)(?:%s?((?:[ \t]|\.\.\n)*)([(])|%s)',
+    (_bmax_name, _bmax_var_suffix, _bmax_var_suffix), re.MULTILINE)
+
+_bmax_func_tokens = (Name.Function, Text, Keyword.Type, Operator, Text,
+                     Punctuation, Text, Keyword.Type, Name.Class, Text,
+                     Keyword.Type, Text, Punctuation)
+_bmax_var_tokens = (Name.Variable, Text, Keyword.Type, Operator, Text,
+                    Punctuation, Text, Keyword.Type, Name.Class, Text,
+                    Keyword.Type)
+
+
+def _bmax_varfunc_callback(lexer, match):
+    """Yield the tokens of a fused function/variable reference match."""
+    if match.group(13) is not None:
+        first, tokens = 1, _bmax_func_tokens
+    else:
+        # the variable form: name group plus the second suffix copy
+        first, tokens = 13, _bmax_var_tokens
+    for i, token in enumerate(tokens):
+        i = 1 if i == 0 else first + i
+        data = match.group(i)
+        if data:
+            yield match.start(i), token, data
+
+_bb_sktypes = r'@{1,2}|[#$%]'
+_bb_name = u'[A-Za-zİıſK]\\w*'
+_bb_var = (r'(%s)(?:([ \t]*)(%s)|([ \t]*)([.])([ \t]*)(?:(%s)))?') % \
+    (_bb_name, _bb_sktypes, _bb_name)
+
+_bb_var_re = _lazy_re('%s', (_bb_var,), re.MULTILINE)
+
+# The five identifier forms (New/Gosub/Goto/Object prefixes, function
+# calls and Function definitions) are matched by one fused alternation,
+# in the same order as the rules they replace, so a candidate identifier
+# is matched once instead of up to five times.
+_bb_ident_re = _lazy_re(
+    r'\b(?:(%s)\b([ \t]+)(%s)'              # New <class>        (1-3)
+    r'|(%s)\b([ \t]+)(%s)'                  # Gosub/Goto <label> (4-6)
+    r'|(%s)\b([ \t]*)([.])([ \t]*)(%s)\b'   # Object.<class>     (7-11)
+    r'|%s\b([ \t]*)(\()'                    # function call      (12-20)
+    r'|(%s)\b([ \t]+)%s)',                  # Function <name>    (21-29)
+    (_ci('New'), _bb_name, _ci('Gosub|Goto'), _bb_name, _ci('Object'),
+     _bb_name, _bb_var, _ci('Function'), _bb_var),
+    re.MULTILINE)
+
+_bb_ident_branches = (
+    (1, (Keyword.Reserved, Text, Name.Class)),
+    (4, (Keyword.Reserved, Text, Name.Label)),
+    (7, (Operator, Text, Punctuation, Text, Name.Class)),
+    (12, (Name.Function, Text, Keyword.Type, Text, Punctuation,
+          Text, Name.Class, Text, Punctuation)),
+    (21, (Keyword.Reserved, Text, Name.Function, Text, Keyword.Type,
+          Text, Punctuation, Text, Name.Class)),
+)
+
+
+def _bb_ident_callback(lexer, match):
+    """Yield the tokens of whichever `_bb_ident_re` branch matched."""
+    for first, tokens in _bb_ident_branches:
+        if match.group(first) is not None:
+            for off, token in enumerate(tokens):
+                data = match.group(first + off)
+                if data:
+                    yield match.start(first + off), token, data
+            return
+
+# All number forms are probed with a single combined regex instead of one
+# rule (and one match attempt) per form; the callback below dispatches on
+# the named group that matched.  The alternatives appear in the same order
+# as the rules they replace.
+_bmax_number_re = re.compile(
+    r'(?P<flt1>[0-9]+\.[0-9]*(?!\.))|(?P<flt2>\.[0-9]*(?!\.))'
+    r'|(?P<int>[0-9]+)|(?P<hex>\$[0-9a-fA-F]+)|(?P<bin>%[10]+)',
+    re.MULTILINE)
+_bb_number_re = re.compile(
+    r'(?P<flt1>[0-9]+\.[0-9]*(?!\.))|(?P<flt2>\.[0-9]+(?!\.))'
+    r'|(?P<int>[0-9]+)|(?P<hex>\$[0-9a-fA-F]+)|(?P<bin>%[10]+)',
+    re.MULTILINE)
+_monkey_number_re = re.compile(
+    r'(?P<flt1>[0-9]+\.[0-9]*(?!\.))|(?P<flt2>\.[0-9]+(?!\.))'
+    r'|(?P<int>[0-9]+)|(?P<hex>\$[0-9a-fA-Z]+)|(?P<bin>%[10]+)',
+    re.MULTILINE)
+
+_fast_bygroups_cache = {}  # arity -> generated generator function
+
+
+def _fast_bygroups(*types):
+    """Like `bygroups`, but restricted to plain token types and with the
+    per-group loop unrolled into generated code, one ``yield`` per group.
+
+    This removes the enumerate/type-check overhead of `bygroups` from
+    rules that are tried at nearly every position.
+    """
+    n = len(types)
+    fn = _fast_bygroups_cache.get(n)
+    if fn is None:
+        src = ['def _callback(match, types):']
+        for i in range(1, n + 1):
+            src.append('    data = match.group(%d)' % i)
+            src.append('    if data:')
+            src.append('        yield match.start(%d), types[%d], data'
+                       % (i, i - 1))
+        namespace = {}
+        exec('\n'.join(src), namespace)
+        fn = _fast_bygroups_cache[n] = namespace['_callback']
+
+    def callback(lexer, match):
+        return fn(match, types)
+    return callback
+
+
+def _by_lastgroup(**tokens):
+    """Return a callback yielding one token whose type is chosen by the
+    name of the group that matched."""
+    def callback(lexer, match):
+        yield match.start(), tokens[match.lastgroup], match.group()
+    return callback
+
+
+_number_callback = _by_lastgroup(
+    flt1=Number.Float, flt2=Number.Float, int=Number.Integer,
+    hex=Number.Hex, bin=Number.Bin)
+
+
+def _blitz_string_body_callback(lexer, match):
+    """Consume the body of a double-quoted string with a single str.find
+    (one C-level scan) instead of driving sre through every character."""
+    text = match.string
+    pos = match.start()
+    end = text.find('"', pos)
+    if end < 0:
+        end = len(text)
+    yield pos, String.Double, text[pos:end]
+
+
+_monkey_rem_delim_re = re.compile(r'(?im)^#(rem|end)')
+
+
+def _monkey_rem_callback(lexer, match):
+    """Consume a (possibly nested) ``#rem`` ... ``#end`` block.
+
+    Instead of pushing a state and re-matching every line, scan straight
+    for the next delimiter while tracking the nesting depth, and yield the
+    whole block as one token.
+    """
+    text = match.string
+    depth = 1
+    pos = match.end()
+    while depth:
+        delim = _monkey_rem_delim_re.search(text, pos)
+        if delim is None:
+            # unterminated: the rest of the text is a comment
+            pos = len(text)
+            break
+        pos = delim.end()
+        if delim.group(1).lower() == 'rem':
+            depth += 1
+        else:
+            depth -= 1
+    yield match.start(), Comment.Multiline, text[match.start():pos]
+
+
+def _monkey_string_body_callback(lexer, match):
+    """Like `_blitz_string_body_callback`, but also stops at the ``~``
+    that introduces Monkey string escapes."""
+    text = match.string
+    pos = match.start()
+    end = text.find('"', pos)
+    tilde = text.find('~', pos)
+    if end < 0 or 0 <= tilde < end:
+        end = tilde
+    if end < 0:
+        end = len(text)
+    yield pos, String.Double, text[pos:end]
+
+
+# BlitzMax and BlitzBasic share identical 'string' states; define (and
+# compile) the rules once so both classes reference the same objects.
+_blitz_string_state = [
+    (re.compile(r'""'), String.Double),
+    (re.compile(r'"[Cc]?'), String.Double, '#pop'),
+    (re.compile(r'(?=[^"])'), _blitz_string_body_callback),
+]
+
+_bmax_endrem_re = re.compile(_ci(r'\bEnd[ \t]*Rem'))
+
+
+def _bmax_rem_callback(lexer, match):
+    """Handle a ``Rem``...``End Rem`` block.
+
+    The closing delimiter is located with a plain regex search instead of
+    a lazy ``.*?``, which backtracks quadratically on long or unterminated
+    blocks.  An unterminated block comments out the rest of the text.
+    """
+    end_match = _bmax_endrem_re.search(match.string, match.end())
+    if end_match:
+        end = end_match.end()
+    else:
+        end = len(match.string)
+    yield match.start(), Comment.Multiline, match.string[match.start():end]
+
+
+# Bare-identifier classification: keywords that used to be matched by
+# several `\b`-anchored alternation rules are looked up in one dict keyed
+# on the lowercased identifier instead, after a single cheap name match.
+
+_bmax_keywords = {}
+for _ws, _tt in [
+    (('Strict', 'SuperStrict', 'Module', 'ModuleInfo',
+      'End', 'Return', 'Continue', 'Exit', 'Public', 'Private',
+      'Var', 'VarPtr', 'Chr', 'Len', 'Asc', 'SizeOf', 'Sgn', 'Abs', 'Min',
+      'Max', 'New', 'Release', 'Delete', 'Incbin', 'IncbinPtr', 'IncbinLen',
+      'Framework', 'Include', 'Import', 'Extern', 'EndExtern',
+      'Function', 'EndFunction', 'Type', 'EndType', 'Extends', 'Method',
+      'EndMethod', 'Abstract', 'Final', 'If', 'Then', 'Else', 'ElseIf',
+      'EndIf', 'For', 'To', 'Next', 'Step', 'EachIn', 'While', 'Wend',
+      'EndWhile', 'Repeat', 'Until', 'Forever', 'Select', 'Case', 'Default',
+      'EndSelect', 'Try', 'Catch', 'EndTry', 'Throw', 'Assert', 'Goto',
+      'DefData', 'ReadData', 'RestoreData'), Keyword.Reserved),
+    (('TNullMethodException', 'TNullFunctionException',
+      'TNullObjectException', 'TArrayBoundsException',
+      'TRuntimeException'), Name.Exception),
+    (('Local', 'Global', 'Const', 'Field'), Keyword.Declaration),
+    (('Pi', 'True', 'False', 'Null', 'Self', 'Super'), Keyword.Constant),
+    (('Ptr',), Keyword.Type),
+]:
+    for _w in _ws:
+        _bmax_keywords[_w.lower()] = _tt
+
+_bb_keywords = {}
+for _ws, _tt in [
+    (('End', 'Return', 'Exit', 'Chr', 'Len', 'Asc', 'New', 'Delete',
+      'Insert', 'Include', 'Function', 'Type', 'If', 'Then', 'Else',
+      'ElseIf', 'EndIf', 'For', 'To', 'Next', 'Step', 'Each', 'While',
+      'Wend', 'Repeat', 'Until', 'Forever', 'Select', 'Case', 'Default',
+      'Goto', 'Gosub', 'Data', 'Read', 'Restore'), Keyword.Reserved),
+    (('Local', 'Global', 'Const', 'Field', 'Dim'), Keyword.Declaration),
+    (('Pi', 'True', 'False', 'Null'), Keyword.Constant),
+]:
+    for _w in _ws:
+        _bb_keywords[_w.lower()] = _tt
+
+
+_ident_fold_map = {0x130: u'i', 0x131: u'i', 0x17f: u's', 0x212a: u'k'}
+
+
+def _fold_ident(name):
+    """Lowercase *name* the way the old ``re.IGNORECASE`` rules folded it:
+    the four non-ASCII fold partners land on their ASCII letters."""
+    try:
+        name.encode('ascii')
+    except UnicodeEncodeError:
+        name = name.translate(_ident_fold_map)
+    return name.lower()
+
+
+def _no_boundary_before(match):
+    """Whether the match is directly preceded by a word character (the
+    `\\b`-anchored keyword rules could not fire at such positions)."""
+    pos = match.start()
+    if not pos:
+        return False
+    prev = match.string[pos - 1]
+    return prev == '_' or prev.isalnum()
+
+
+def _bmax_name_callback(lexer, match):
+    name = match.group()
+    if _no_boundary_before(match):
+        token = Name.Variable
+    else:
+        token = _bmax_keywords.get(_fold_ident(name), Name.Variable)
+    yield match.start(), token, name
+
+
+_bb_var_groups_callback = _fast_bygroups(
+    Name.Variable, Text, Keyword.Type, Text, Punctuation, Text, Name.Class)
+
+
+def _bb_name_callback(lexer, match):
+    # a bare name is classified by dict lookup; a name with a type sigil
+    # or field access keeps the variable-form group tokens
+    if match.end() == match.end(1) and not _no_boundary_before(match):
+        name = match.group(1)
+        token = _bb_keywords.get(_fold_ident(name), Name.Variable)
+        return iter(((match.start(), token, name),))
+    return _bb_var_groups_callback(lexer, match)
+
+
+_token_cache = {}  # (lexer class, stack, content hash) -> tuple of tokens
+_token_cache_max = 128
+_token_cache_maxtext = 100000
+
+
+def _cached_tokens(lexer, text, stack):
+    """Memoized ``get_tokens_unprocessed`` for the Blitz lexers.
+
+    Documentation builders lex the same snippets over and over across
+    incremental rebuilds; keying the finished token stream on a content
+    hash turns repeat runs into a single dict lookup.  The token output
+    depends only on the lexer class, so one module-level cache (capped at
+    `_token_cache_max` entries) serves all instances.  Texts longer than
+    `_token_cache_maxtext` are streamed uncached: materializing and
+    retaining their token streams would cost more memory than the
+    re-lexing is worth.
+    """
+    if len(text) > _token_cache_maxtext:
+        return FastDispatchRegexLexer.get_tokens_unprocessed(
+            lexer, text, stack)
+    # `stack` may be any iterable, and lone surrogates must hash like any
+    # other text, so normalize both before building the key
+    key = (type(lexer), tuple(stack),
+           hashlib.sha1(text.encode('utf-8', 'surrogatepass')).digest())
+    try:
+        return _token_cache[key]
+    except KeyError:
+        if len(_token_cache) >= _token_cache_max:
+            _token_cache.clear()
+        tokens = _token_cache[key] = tuple(
+            FastDispatchRegexLexer.get_tokens_unprocessed(lexer, text, stack))
+        return tokens
+
+
+class BlitzMaxLexer(FastDispatchRegexLexer):
     """
     For `BlitzMax <http://blitzbasic.com>`_ source code.
 
@@ -31,16 +444,7 @@ class BlitzMaxLexer(RegexLexer):
     filenames = ['*.bmx']
     mimetypes = ['text/x-bmx']
 
-    bmax_vopwords = r'\b(Shl|Shr|Sar|Mod)\b'
-    bmax_sktypes = r'@{1,2}|[!#$%]'
-    bmax_lktypes = r'\b(Int|Byte|Short|Float|Double|Long)\b'
-    bmax_name = r'[a-z_]\w*'
-    bmax_var = (r'(%s)(?:(?:([ \t]*)(%s)|([ \t]*:[ \t]*\b(?:Shl|Shr|Sar|Mod)\b)'
-                r'|([ \t]*)(:)([ \t]*)(?:%s|(%s)))(?:([ \t]*)(Ptr))?)') % \
-        (bmax_name, bmax_sktypes, bmax_lktypes, bmax_name)
-    bmax_func = bmax_var + r'?((?:[ \t]|\.\.\n)*)([(])'
-
-    flags = re.MULTILINE | re.IGNORECASE
+    flags = re.MULTILINE
     tokens = {
         'root': [
             # Text
@@ -48,69 +452,38 @@ class BlitzMaxLexer(RegexLexer):
             (r'\.\.\n', Text),  # Line continuation
             # Comments
             (r"'.*?\n", Comment.Single),
-            (r'([ \t]*)\bRem\n(\n|.)*?\s*\bEnd([ \t]*)Rem', Comment.Multiline),
+            (_ci(r'[ \t]*\bRem\n'), _bmax_rem_callback),
             # Data types
             ('"', String.Double, 'string'),
             # Numbers
-            (r'[0-9]+\.[0-9]*(?!\.)', Number.Float),
-            (r'\.[0-9]*(?!\.)', Number.Float),
-            (r'[0-9]+', Number.Integer),
-            (r'\$[0-9a-f]+', Number.Hex),
-            (r'\%[10]+', Number.Bin),
+            (_bmax_number_re, _number_callback),
             # Other
-            (r'(?:(?:(:)?([ \t]*)(:?%s|([+\-*/&|~]))|Or|And|Not|[=<>^]))' %
-             (bmax_vopwords), Operator),
+            (r':?[ \t]*(?::?%s|[+\-*/&|~])|%s|[=<>^]' %
+             (_bmax_vopwords, _ci('Or|And|Not')), Operator),
             (r'[(),.:\[\]]', Punctuation),
-            (r'(?:#[\w \t]*)', Name.Label),
-            (r'(?:\?[\w \t]*)', Comment.Preproc),
+            (r'#[\w \t]*', Name.Label),
+            (r'\?[\w \t]*', Comment.Preproc),
             # Identifiers
-            (r'\b(New)\b([ \t]?)([(]?)(%s)' % (bmax_name),
-             bygroups(Keyword.Reserved, Text, Punctuation, Name.Class)),
-            (r'\b(Import|Framework|Module)([ \t]+)(%s\.%s)' %
-             (bmax_name, bmax_name),
-             bygroups(Keyword.Reserved, Text, Keyword.Namespace)),
-            (bmax_func, bygroups(Name.Function, Text, Keyword.Type,
-                                 Operator, Text, Punctuation, Text,
-                                 Keyword.Type, Name.Class, Text,
-                                 Keyword.Type, Text, Punctuation)),
-            (bmax_var, bygroups(Name.Variable, Text, Keyword.Type, Operator,
-                                Text, Punctuation, Text, Keyword.Type,
-                                Name.Class, Text, Keyword.Type)),
-            (r'\b(Type|Extends)([ \t]+)(%s)' % (bmax_name),
-             bygroups(Keyword.Reserved, Text, Name.Class)),
-            # Keywords
-            (r'\b(Ptr)\b', Keyword.Type),
-            (r'\b(Pi|True|False|Null|Self|Super)\b', Keyword.Constant),
-            (r'\b(Local|Global|Const|Field)\b', Keyword.Declaration),
-            (words((
-                'TNullMethodException', 'TNullFunctionException',
-                'TNullObjectException', 'TArrayBoundsException',
-                'TRuntimeException'), prefix=r'\b', suffix=r'\b'), Name.Exception),
-            (words((
-                'Strict', 'SuperStrict', 'Module', 'ModuleInfo',
-                'End', 'Return', 'Continue', 'Exit', 'Public', 'Private',
-                'Var', 'VarPtr', 'Chr', 'Len', 'Asc', 'SizeOf', 'Sgn', 'Abs', 'Min', 'Max',
-                'New', 'Release', 'Delete', 'Incbin', 'IncbinPtr', 'IncbinLen',
-                'Framework', 'Include', 'Import', 'Extern', 'EndExtern',
-                'Function', 'EndFunction', 'Type', 'EndType', 'Extends', 'Method', 'EndMethod',
-                'Abstract', 'Final', 'If', 'Then', 'Else', 'ElseIf', 'EndIf',
-                'For', 'To', 'Next', 'Step', 'EachIn', 'While', 'Wend', 'EndWhile',
-                'Repeat', 'Until', 'Forever', 'Select', 'Case', 'Default', 'EndSelect',
-                'Try', 'Catch', 'EndTry', 'Throw', 'Assert', 'Goto', 'DefData', 'ReadData',
-                'RestoreData'), prefix=r'\b', suffix=r'\b'),
-             Keyword.Reserved),
-            # Final resolve (for variable names and such)
-            (r'(%s)' % (bmax_name), Name.Variable),
-        ],
-        'string': [
-            (r'""', String.Double),
-            (r'"C?', String.Double, '#pop'),
-            (r'[^"]+', String.Double),
+            (r'\b(%s)\b([ \t]?)([(]?)(%s)' % (_ci('New'), _bmax_name),
+             _fast_bygroups(Keyword.Reserved, Text, Punctuation, Name.Class)),
+            (r'\b(%s)([ \t]+)(%s\.%s)' %
+             (_ci('Import|Framework|Module'), _bmax_name, _bmax_name),
+             _fast_bygroups(Keyword.Reserved, Text, Keyword.Namespace)),
+            (_bmax_varfunc_re, _bmax_varfunc_callback),
+            (r'\b(%s)([ \t]+)(%s)' % (_ci('Type|Extends'), _bmax_name),
+             _fast_bygroups(Keyword.Reserved, Text, Name.Class)),
+            # Keywords, and the final resolve for variable names: one name
+            # match classified through `_bmax_keywords`
+            (_bmax_name, _bmax_name_callback),
         ],
+        'string': _blitz_string_state,
     }
 
+    def get_tokens_unprocessed(self, text, stack=('root',)):
+        return iter(_cached_tokens(self, text, stack))
 
-class BlitzBasicLexer(RegexLexer):
+
+class BlitzBasicLexer(FastDispatchRegexLexer):
     """
     For `BlitzBasic <http://blitzbasic.com>`_ source code.
 
@@ -122,12 +495,7 @@ class BlitzBasicLexer(RegexLexer):
     filenames = ['*.bb', '*.decls']
     mimetypes = ['text/x-bb']
 
-    bb_sktypes = r'@{1,2}|[#$%]'
-    bb_name = r'[a-z]\w*'
-    bb_var = (r'(%s)(?:([ \t]*)(%s)|([ \t]*)([.])([ \t]*)(?:(%s)))?') % \
-             (bb_name, bb_sktypes, bb_name)
-
-    flags = re.MULTILINE | re.IGNORECASE
+    flags = re.MULTILINE
     tokens = {
         'root': [
             # Text
@@ -137,59 +505,31 @@ class BlitzBasicLexer(RegexLexer):
             # Data types
             ('"', String.Double, 'string'),
             # Numbers
-            (r'[0-9]+\.[0-9]*(?!\.)', Number.Float),
-            (r'\.[0-9]+(?!\.)', Number.Float),
-            (r'[0-9]+', Number.Integer),
-            (r'\$[0-9a-f]+', Number.Hex),
-            (r'\%[10]+', Number.Bin),
+            (_bb_number_re, _number_callback),
             # Other
-            (words(('Shl', 'Shr', 'Sar', 'Mod', 'Or', 'And', 'Not',
-                    'Abs', 'Sgn', 'Handle', 'Int', 'Float', 'Str',
-                    'First', 'Last', 'Before', 'After'),
-                   prefix=r'\b', suffix=r'\b'),
+            (_ci_words(('Shl', 'Shr', 'Sar', 'Mod', 'Or', 'And', 'Not',
+                        'Abs', 'Sgn', 'Handle', 'Int', 'Float', 'Str',
+                        'First', 'Last', 'Before', 'After')),
              Operator),
-            (r'([+\-*/~=<>^])', Operator),
+            (r'[+\-*/~=<>^]', Operator),
             (r'[(),:\[\]\\]', Punctuation),
-            (r'\.([ \t]*)(%s)' % bb_name, Name.Label),
+            (r'\.[ \t]*%s' % _bb_name, Name.Label),
             # Identifiers
-            (r'\b(New)\b([ \t]+)(%s)' % (bb_name),
-             bygroups(Keyword.Reserved, Text, Name.Class)),
-            (r'\b(Gosub|Goto)\b([ \t]+)(%s)' % (bb_name),
-             bygroups(Keyword.Reserved, Text, Name.Label)),
-            (r'\b(Object)\b([ \t]*)([.])([ \t]*)(%s)\b' % (bb_name),
-             bygroups(Operator, Text, Punctuation, Text, Name.Class)),
-            (r'\b%s\b([ \t]*)(\()' % bb_var,
-             bygroups(Name.Function, Text, Keyword.Type, Text, Punctuation,
-                      Text, Name.Class, Text, Punctuation)),
-            (r'\b(Function)\b([ \t]+)%s' % bb_var,
-             bygroups(Keyword.Reserved, Text, Name.Function, Text, Keyword.Type,
-                      Text, Punctuation, Text, Name.Class)),
-            (r'\b(Type)([ \t]+)(%s)' % (bb_name),
-             bygroups(Keyword.Reserved, Text, Name.Class)),
-            # Keywords
-            (r'\b(Pi|True|False|Null)\b', Keyword.Constant),
-            (r'\b(Local|Global|Const|Field|Dim)\b', Keyword.Declaration),
-            (words((
-                'End', 'Return', 'Exit', 'Chr', 'Len', 'Asc', 'New', 'Delete', 'Insert',
-                'Include', 'Function', 'Type', 'If', 'Then', 'Else', 'ElseIf', 'EndIf',
-                'For', 'To', 'Next', 'Step', 'Each', 'While', 'Wend',
-                'Repeat', 'Until', 'Forever', 'Select', 'Case', 'Default',
-                'Goto', 'Gosub', 'Data', 'Read', 'Restore'), prefix=r'\b', suffix=r'\b'),
-             Keyword.Reserved),
-            # Final resolve (for variable names and such)
-            # (r'(%s)' % (bb_name), Name.Variable),
-            (bb_var, bygroups(Name.Variable, Text, Keyword.Type,
-                              Text, Punctuation, Text, Name.Class)),
-        ],
-        'string': [
-            (r'""', String.Double),
-            (r'"C?', String.Double, '#pop'),
-            (r'[^"]+', String.Double),
+            (_bb_ident_re, _bb_ident_callback),
+            (r'\b(%s)([ \t]+)(%s)' % (_ci('Type'), _bb_name),
+             _fast_bygroups(Keyword.Reserved, Text, Name.Class)),
+            # Keywords, and the final resolve for variable names: one
+            # variable match classified through `_bb_keywords`
+            (_bb_var_re, _bb_name_callback),
         ],
+        'string': _blitz_string_state,
     }
 
+    def get_tokens_unprocessed(self, text, stack=('root',)):
+        return iter(_cached_tokens(self, text, stack))
 
-class MonkeyLexer(RegexLexer):
+
+class MonkeyLexer(FastDispatchRegexLexer):
     """
     For
     `Monkey <https://en.wikipedia.org/wiki/Monkey_(programming_language)>`_
@@ -213,6 +553,14 @@ class MonkeyLexer(RegexLexer):
     # ? == Bool // % == Int // # == Float // $ == String
     keyword_type_special = r'[?%#$]'
 
+    # runs of 'classname' rules with the same state transition, merged into
+    # single alternations so one match attempt replaces several
+    _classname_re = re.compile(
+        r'(?P<ns>%s\.)|(?P<kt>%s\b)|(?P<cls>%s)\b' %
+        (name_module, keyword_type, name_class), re.MULTILINE)
+    _classname_pop_re = re.compile(r'(?P<ws>\s+(?!<))|(?P<gt>>)|(?P<nl>\n)',
+                                   re.MULTILINE)
+
     flags = re.MULTILINE
 
     tokens = {
@@ -221,7 +569,7 @@ class MonkeyLexer(RegexLexer):
             (r'\s+', Text),
             # Comments
             (r"'.*", Comment),
-            (r'(?i)^#rem\b', Comment.Multiline, 'comment'),
+            (r'(?i)^#rem\b', _monkey_rem_callback),
             # preprocessor directives
             (r'(?i)^(?:#If|#ElseIf|#Else|#EndIf|#End|#Print|#Error)\b', Comment.Preproc),
             # preprocessor variable (any line starting with '#' that is not a directive)
@@ -229,11 +577,7 @@ class MonkeyLexer(RegexLexer):
             # String
             ('"', String.Double, 'string'),
             # Numbers
-            (r'[0-9]+\.[0-9]*(?!\.)', Number.Float),
-            (r'\.[0-9]+(?!\.)', Number.Float),
-            (r'[0-9]+', Number.Integer),
-            (r'\$[0-9a-fA-Z]+', Number.Hex),
-            (r'\%[10]+', Number.Bin),
+            (_monkey_number_re, _number_callback),
             # Native data types
             (r'\b%s\b' % keyword_type, Keyword.Type),
             # Exception handling
@@ -283,17 +627,15 @@ class MonkeyLexer(RegexLexer):
             (r'\)', Punctuation, '#pop')
         ],
         'classname': [
-            (r'%s\.' % name_module, Name.Namespace),
-            (r'%s\b' % keyword_type, Keyword.Type),
-            (r'%s\b' % name_class, Name.Class),
+            (_classname_re, _by_lastgroup(ns=Name.Namespace, kt=Keyword.Type,
+                                          cls=Name.Class)),
             # array (of given size)
             (r'(\[)(\s*)(\d*)(\s*)(\])',
              bygroups(Punctuation, Text, Number.Integer, Text, Punctuation)),
-            # generics
-            (r'\s+(?!<)', Text, '#pop'),
+            # generics; whitespace, '>' and newline all leave the state
+            (_classname_pop_re,
+             _by_lastgroup(ws=Text, gt=Punctuation, nl=Text), '#pop'),
             (r'<', Punctuation, '#push'),
-            (r'>', Punctuation, '#pop'),
-            (r'\n', Text, '#pop'),
             default('#pop')
         ],
         'variables': [
@@ -306,18 +648,15 @@ class MonkeyLexer(RegexLexer):
             default('#pop')
         ],
         'string': [
-            (r'[^"~]+', String.Double),
+            (r'(?=[^"~])', _monkey_string_body_callback),
             (r'~q|~n|~r|~t|~z|~~', String.Escape),
             (r'"', String.Double, '#pop'),
         ],
-        'comment': [
-            (r'(?i)^#rem.*?', Comment.Multiline, "#push"),
-            (r'(?i)^#end.*?', Comment.Multiline, "#pop"),
-            (r'\n', Comment.Multiline),
-            (r'.+', Comment.Multiline),
-        ],
     }
 
+    def get_tokens_unprocessed(self, text, stack=('root',)):
+        return iter(_cached_tokens(self, text, stack))
+
 
 class CbmBasicV2Lexer(RegexLexer):
     """
@@ -80,6 +80,9 @@ def regex_opt_inner(strings, open_paren):
         + close_paren
 
 
+_opt_cache = {}  # (strings, prefix, suffix) -> regex
+
+
 def regex_opt(strings, prefix='', suffix=''):
     """Return a compiled regex that matches any string in the given list.
 
@@ -87,6 +90,14 @@ def regex_opt(strings, prefix='', suffix=''):
     regex-escaped.
 
     *prefix* and *suffix* are pre- and appended to the final regex.
+
+    The result is cached, so the (recursive) optimization work is only done
+    once per distinct word list for the lifetime of the interpreter.
     """
-    strings = sorted(strings)
-    return prefix + regex_opt_inner(strings, '(') + suffix
+    strings = tuple(sorted(strings))
+    key = (strings, prefix, suffix)
+    try:
+        return _opt_cache[key]
+    except KeyError:
+        rex = _opt_cache[key] = prefix + regex_opt_inner(strings, '(') + suffix
+        return rex
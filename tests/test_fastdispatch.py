@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+"""
+    Pygments fast-dispatch lexer tests
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Tests for `FastDispatchRegexLexer` and the optimized Blitz/Monkey
+    lexers built on it: first-character analysis soundness, equivalence
+    with the pre-optimization token streams, and the profiling/caching
+    regressions.
+
+    :copyright: Copyright 2006-2017 by the Pygments team, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+"""
+
+import io
+import os
+import re
+import unittest
+
+from pygments.lexer import RegexLexer, ProfilingRegexLexer, \
+    ProfilingRegexLexerMeta, bygroups, default, words, regex_first_chars
+from pygments.token import Text, Comment, Operator, Keyword, Name, String, \
+    Number, Punctuation, Token
+from pygments.lexers.basic import BlitzMaxLexer, BlitzBasicLexer, MonkeyLexer
+
+TESTDIR = os.path.dirname(__file__)
+
+FAST_LEXERS = (BlitzMaxLexer, BlitzBasicLexer, MonkeyLexer)
+
+
+# ------------------------------------------------------------------------
+# Reference lexers: verbatim copies of the token definitions these lexers
+# had before the fast-dispatch/fusion optimizations, used as ground truth.
+
+bmax_vopwords = r'\b(Shl|Shr|Sar|Mod)\b'
+bmax_sktypes = r'@{1,2}|[!#$%]'
+bmax_lktypes = r'\b(Int|Byte|Short|Float|Double|Long)\b'
+bmax_name = r'[a-z_]\w*'
+bmax_var = (r'(%s)(?:(?:([ \t]*)(%s)|([ \t]*:[ \t]*\b(?:Shl|Shr|Sar|Mod)\b)'
+            r'|([ \t]*)(:)([ \t]*)(?:%s|(%s)))(?:([ \t]*)(Ptr))?)') % \
+    (bmax_name, bmax_sktypes, bmax_lktypes, bmax_name)
+bmax_func = bmax_var + r'?((?:[ \t]|\.\.\n)*)([(])'
+
+
+class RefBlitzMaxLexer(RegexLexer):
+    name = 'BlitzMax (reference)'
+    flags = re.MULTILINE | re.IGNORECASE
+    tokens = {
+        'root': [
+            (r'[ \t]+', Text),
+            (r'\.\.\n', Text),
+            (r"'.*?\n", Comment.Single),
+            (r'([ \t]*)\bRem\n(\n|.)*?\s*\bEnd([ \t]*)Rem', Comment.Multiline),
+            ('"', String.Double, 'string'),
+            (r'[0-9]+\.[0-9]*(?!\.)', Number.Float),
+            (r'\.[0-9]*(?!\.)', Number.Float),
+            (r'[0-9]+', Number.Integer),
+            (r'\$[0-9a-f]+', Number.Hex),
+            (r'\%[10]+', Number.Bin),
+            (r'(?:(?:(:)?([ \t]*)(:?%s|([+\-*/&|~]))|Or|And|Not|[=<>^]))' %
+             (bmax_vopwords), Operator),
+            (r'[(),.:\[\]]', Punctuation),
+            (r'(?:#[\w \t]*)', Name.Label),
+            (r'(?:\?[\w \t]*)', Comment.Preproc),
+            (r'\b(New)\b([ \t]?)([(]?)(%s)' % (bmax_name),
+             bygroups(Keyword.Reserved, Text, Punctuation, Name.Class)),
+            (r'\b(Import|Framework|Module)([ \t]+)(%s\.%s)' %
+             (bmax_name, bmax_name),
+             bygroups(Keyword.Reserved, Text, Keyword.Namespace)),
+            (bmax_func, bygroups(Name.Function, Text, Keyword.Type,
+                                 Operator, Text, Punctuation, Text,
+                                 Keyword.Type, Name.Class, Text,
+                                 Keyword.Type, Text, Punctuation)),
+            (bmax_var, bygroups(Name.Variable, Text, Keyword.Type, Operator,
+                                Text, Punctuation, Text, Keyword.Type,
+                                Name.Class, Text, Keyword.Type)),
+            (r'\b(Type|Extends)([ \t]+)(%s)' % (bmax_name),
+             bygroups(Keyword.Reserved, Text, Name.Class)),
+            (r'\b(Ptr)\b', Keyword.Type),
+            (r'\b(Pi|True|False|Null|Self|Super)\b', Keyword.Constant),
+            (r'\b(Local|Global|Const|Field)\b', Keyword.Declaration),
+            (words((
+                'TNullMethodException', 'TNullFunctionException',
+                'TNullObjectException', 'TArrayBoundsException',
+                'TRuntimeException'), prefix=r'\b', suffix=r'\b'),
+             Name.Exception),
+            (words((
+                'Strict', 'SuperStrict', 'Module', 'ModuleInfo',
+                'End', 'Return', 'Continue', 'Exit', 'Public', 'Private',
+                'Var', 'VarPtr', 'Chr', 'Len', 'Asc', 'SizeOf', 'Sgn', 'Abs',
+                'Min', 'Max', 'New', 'Release', 'Delete', 'Incbin',
+                'IncbinPtr', 'IncbinLen', 'Framework', 'Include', 'Import',
+                'Extern', 'EndExtern', 'Function', 'EndFunction', 'Type',
+                'EndType', 'Extends', 'Method', 'EndMethod',
+                'Abstract', 'Final', 'If', 'Then', 'Else', 'ElseIf', 'EndIf',
+                'For', 'To', 'Next', 'Step', 'EachIn', 'While', 'Wend',
+                'EndWhile', 'Repeat', 'Until', 'Forever', 'Select', 'Case',
+                'Default', 'EndSelect', 'Try', 'Catch', 'EndTry', 'Throw',
+                'Assert', 'Goto', 'DefData', 'ReadData', 'RestoreData'),
+                prefix=r'\b', suffix=r'\b'),
+             Keyword.Reserved),
+            (r'(%s)' % (bmax_name), Name.Variable),
+        ],
+        'string': [
+            (r'""', String.Double),
+            (r'"C?', String.Double, '#pop'),
+            (r'[^"]+', String.Double),
+        ],
+    }
+
+
+bb_sktypes = r'@{1,2}|[#$%]'
+bb_name = r'[a-z]\w*'
+bb_var = (r'(%s)(?:([ \t]*)(%s)|([ \t]*)([.])([ \t]*)(?:(%s)))?') % \
+         (bb_name, bb_sktypes, bb_name)
+
+
+class RefBlitzBasicLexer(RegexLexer):
+    name = 'BlitzBasic (reference)'
+    flags = re.MULTILINE | re.IGNORECASE
+    tokens = {
+        'root': [
+            (r'[ \t]+', Text),
+            (r";.*?\n", Comment.Single),
+            ('"', String.Double, 'string'),
+            (r'[0-9]+\.[0-9]*(?!\.)', Number.Float),
+            (r'\.[0-9]+(?!\.)', Number.Float),
+            (r'[0-9]+', Number.Integer),
+            (r'\$[0-9a-f]+', Number.Hex),
+            (r'\%[10]+', Number.Bin),
+            (words(('Shl', 'Shr', 'Sar', 'Mod', 'Or', 'And', 'Not',
+                    'Abs', 'Sgn', 'Handle', 'Int', 'Float', 'Str',
+                    'First', 'Last', 'Before', 'After'),
+                   prefix=r'\b', suffix=r'\b'),
+             Operator),
+            (r'([+\-*/~=<>^])', Operator),
+            (r'[(),:\[\]\\]', Punctuation),
+            (r'\.([ \t]*)(%s)' % bb_name, Name.Label),
+            (r'\b(New)\b([ \t]+)(%s)' % (bb_name),
+             bygroups(Keyword.Reserved, Text, Name.Class)),
+            (r'\b(Gosub|Goto)\b([ \t]+)(%s)' % (bb_name),
+             bygroups(Keyword.Reserved, Text, Name.Label)),
+            (r'\b(Object)\b([ \t]*)([.])([ \t]*)(%s)\b' % (bb_name),
+             bygroups(Operator, Text, Punctuation, Text, Name.Class)),
+            (r'\b%s\b([ \t]*)(\()' % bb_var,
+             bygroups(Name.Function, Text, Keyword.Type, Text, Punctuation,
+                      Text, Name.Class, Text, Punctuation)),
+            (r'\b(Function)\b([ \t]+)%s' % bb_var,
+             bygroups(Keyword.Reserved, Text, Name.Function, Text,
+                      Keyword.Type, Text, Punctuation, Text, Name.Class)),
+            (r'\b(Type)([ \t]+)(%s)' % (bb_name),
+             bygroups(Keyword.Reserved, Text, Name.Class)),
+            (r'\b(Pi|True|False|Null)\b', Keyword.Constant),
+            (r'\b(Local|Global|Const|Field|Dim)\b', Keyword.Declaration),
+            (words((
+                'End', 'Return', 'Exit', 'Chr', 'Len', 'Asc', 'New',
+                'Delete', 'Insert', 'Include', 'Function', 'Type', 'If',
+                'Then', 'Else', 'ElseIf', 'EndIf', 'For', 'To', 'Next',
+                'Step', 'Each', 'While', 'Wend', 'Repeat', 'Until',
+                'Forever', 'Select', 'Case', 'Default', 'Goto', 'Gosub',
+                'Data', 'Read', 'Restore'), prefix=r'\b', suffix=r'\b'),
+             Keyword.Reserved),
+            (bb_var, bygroups(Name.Variable, Text, Keyword.Type,
+                              Text, Punctuation, Text, Name.Class)),
+        ],
+        'string': [
+            (r'""', String.Double),
+            (r'"C?', String.Double, '#pop'),
+            (r'[^"]+', String.Double),
+        ],
+    }
+
+
+class RefMonkeyLexer(RegexLexer):
+    name = 'Monkey (reference)'
+
+    name_variable = r'[a-z_]\w*'
+    name_function = r'[A-Z]\w*'
+    name_constant = r'[A-Z_][A-Z0-9_]*'
+    name_class = r'[A-Z]\w*'
+    name_module = r'[a-z0-9_]*'
+
+    keyword_type = r'(?:Int|Float|String|Bool|Object|Array|Void)'
+    keyword_type_special = r'[?%#$]'
+
+    flags = re.MULTILINE
+
+    tokens = {
+        'root': [
+            (r'\s+', Text),
+            (r"'.*", Comment),
+            (r'(?i)^#rem\b', Comment.Multiline, 'comment'),
+            (r'(?i)^(?:#If|#ElseIf|#Else|#EndIf|#End|#Print|#Error)\b',
+             Comment.Preproc),
+            (r'^#', Comment.Preproc, 'variables'),
+            ('"', String.Double, 'string'),
+            (r'[0-9]+\.[0-9]*(?!\.)', Number.Float),
+            (r'\.[0-9]+(?!\.)', Number.Float),
+            (r'[0-9]+', Number.Integer),
+            (r'\$[0-9a-fA-Z]+', Number.Hex),
+            (r'\%[10]+', Number.Bin),
+            (r'\b%s\b' % keyword_type, Keyword.Type),
+            (r'(?i)\b(?:Try|Catch|Throw)\b', Keyword.Reserved),
+            (r'Throwable', Name.Exception),
+            (r'(?i)\b(?:Null|True|False)\b', Name.Builtin),
+            (r'(?i)\b(?:Self|Super)\b', Name.Builtin.Pseudo),
+            (r'\b(?:HOST|LANG|TARGET|CONFIG)\b', Name.Constant),
+            (r'(?i)^(Import)(\s+)(.*)(\n)',
+             bygroups(Keyword.Namespace, Text, Name.Namespace, Text)),
+            (r'(?i)^Strict\b.*\n', Keyword.Reserved),
+            (r'(?i)(Const|Local|Global|Field)(\s+)',
+             bygroups(Keyword.Declaration, Text), 'variables'),
+            (r'(?i)(New|Class|Interface|Extends|Implements)(\s+)',
+             bygroups(Keyword.Reserved, Text), 'classname'),
+            (r'(?i)(Function|Method)(\s+)',
+             bygroups(Keyword.Reserved, Text), 'funcname'),
+            (r'(?i)(?:End|Return|Public|Private|Extern|Property|'
+             r'Final|Abstract)\b', Keyword.Reserved),
+            (r'(?i)(?:If|Then|Else|ElseIf|EndIf|'
+             r'Select|Case|Default|'
+             r'While|Wend|'
+             r'Repeat|Until|Forever|'
+             r'For|To|Until|Step|EachIn|Next|'
+             r'Exit|Continue)\s+', Keyword.Reserved),
+            (r'(?i)\b(?:Module|Inline)\b', Keyword.Reserved),
+            (r'[\[\]]', Punctuation),
+            (r'<=|>=|<>|\*=|/=|\+=|-=|&=|~=|\|=|[-&*/^+=<>|~]', Operator),
+            (r'(?i)(?:Not|Mod|Shl|Shr|And|Or)', Operator.Word),
+            (r'[(){}!#,.:]', Punctuation),
+            (r'%s\b' % name_constant, Name.Constant),
+            (r'%s\b' % name_function, Name.Function),
+            (r'%s\b' % name_variable, Name.Variable),
+        ],
+        'funcname': [
+            (r'(?i)%s\b' % name_function, Name.Function),
+            (r':', Punctuation, 'classname'),
+            (r'\s+', Text),
+            (r'\(', Punctuation, 'variables'),
+            (r'\)', Punctuation, '#pop')
+        ],
+        'classname': [
+            (r'%s\.' % name_module, Name.Namespace),
+            (r'%s\b' % keyword_type, Keyword.Type),
+            (r'%s\b' % name_class, Name.Class),
+            (r'(\[)(\s*)(\d*)(\s*)(\])',
+             bygroups(Punctuation, Text, Number.Integer, Text, Punctuation)),
+            (r'\s+(?!<)', Text, '#pop'),
+            (r'<', Punctuation, '#push'),
+            (r'>', Punctuation, '#pop'),
+            (r'\n', Text, '#pop'),
+            default('#pop')
+        ],
+        'variables': [
+            (r'%s\b' % name_constant, Name.Constant),
+            (r'%s\b' % name_variable, Name.Variable),
+            (r'%s' % keyword_type_special, Keyword.Type),
+            (r'\s+', Text),
+            (r':', Punctuation, 'classname'),
+            (r',', Punctuation, '#push'),
+            default('#pop')
+        ],
+        'string': [
+            (r'[^"~]+', String.Double),
+            (r'~q|~n|~r|~t|~z|~~', String.Escape),
+            (r'"', String.Double, '#pop'),
+        ],
+        'comment': [
+            (r'(?i)^#rem.*?', Comment.Multiline, "#push"),
+            (r'(?i)^#end.*?', Comment.Multiline, "#pop"),
+            (r'\n', Comment.Multiline),
+            (r'.+', Comment.Multiline),
+        ],
+    }
+
+
+def merge_adjacent(tokens):
+    """Merge adjacent tokens of the same type, the only difference the
+    optimized lexers are allowed to introduce."""
+    out = []
+    for ttype, value in tokens:
+        if out and out[-1][0] is ttype:
+            out[-1] = (ttype, out[-1][1] + value)
+        else:
+            out.append((ttype, value))
+    return out
+
+
+class FirstCharsSoundnessTest(unittest.TestCase):
+    """`regex_first_chars` may over-approximate, never under-approximate:
+    whenever a rule regex matches, the first input character must be in
+    the reported set (or the set must be None)."""
+
+    alphabet = [chr(c) for c in range(32, 127)] + \
+        list(u'\t\nİıſK\xe9Ω')
+    suffixes = [u'', u'a', u'A', u'1', u'"', u'(', u' ', u'\n', u'rem\n']
+
+    def test_shipped_lexer_rules(self):
+        for cls in FAST_LEXERS:
+            inst = cls()
+            for state, rules in inst._tokens.items():
+                for rule in rules:
+                    rex = rule[0].__self__
+                    chars = regex_first_chars(rex)
+                    if chars is None:
+                        continue
+                    for ch in self.alphabet:
+                        if ord(ch) in chars:
+                            continue
+                        for suffix in self.suffixes:
+                            self.assertTrue(
+                                rex.match(ch + suffix) is None,
+                                '%s %r: %r matches %r but %r is not in '
+                                'the first-char set' %
+                                (cls.__name__, state, rex.pattern,
+                                 ch + suffix, ch))
+
+
+class BaselineEquivalenceTest(unittest.TestCase):
+    """The optimized lexers must produce the reference token streams for
+    the example files, up to merging adjacent same-type tokens."""
+
+    def check(self, lexer, reference, filename):
+        fn = os.path.join(TESTDIR, 'examplefiles', filename)
+        with io.open(fn, encoding='utf-8') as fp:
+            text = fp.read()
+        new = merge_adjacent(lexer().get_tokens(text))
+        ref = merge_adjacent(reference().get_tokens(text))
+        self.assertEqual(new, ref)
+
+    def test_blitzmax_example(self):
+        self.check(BlitzMaxLexer, RefBlitzMaxLexer, 'test.bmx')
+
+    def test_blitzbasic_example(self):
+        self.check(BlitzBasicLexer, RefBlitzBasicLexer, 'test.bb')
+
+    def test_monkey_example(self):
+        self.check(MonkeyLexer, RefMonkeyLexer, 'example.monkey')
+
+
+class FastDispatchRegressionTest(unittest.TestCase):
+    def test_profiling_subclass(self):
+        # lazily compiled patterns and scan-ahead callbacks must survive
+        # the profiling metaclass, which lexes via the base RegexLexer
+        # loop; the fragments deliberately contain strings and comment
+        # blocks, whose callbacks yield beyond their trigger match
+        fragments = [
+            (BlitzMaxLexer, u'Rem\nhello comment\nEnd Rem\n'
+                            u'Local s:String = "hello" + 1\n'),
+            (BlitzBasicLexer, u'If x Then y = "hello" EndIf\n'),
+            (MonkeyLexer, u'#rem\nnested\n#rem\nx\n#end\n#end\n'
+                          u'Local s:String = "hi~n"\n'),
+        ]
+        for cls, fragment in fragments:
+            prof = ProfilingRegexLexerMeta(
+                str('Profiling' + cls.__name__),
+                (ProfilingRegexLexer, cls), {'_prof_data': []})
+            self.assertEqual(list(prof().get_tokens(fragment)),
+                             list(cls().get_tokens(fragment)))
+
+    def test_stack_may_be_a_list(self):
+        lx = BlitzBasicLexer()
+        self.assertEqual(list(lx.get_tokens_unprocessed(u'x\n',
+                                                        stack=['root'])),
+                         list(lx.get_tokens_unprocessed(u'x\n',
+                                                        stack=('root',))))
+
+    def test_lone_surrogates(self):
+        lx = BlitzMaxLexer()
+        text = u'x \ud800 y\n'
+        tokens = list(lx.get_tokens_unprocessed(text))
+        self.assertEqual(u''.join(v for _, _, v in tokens), text)
+
+    def test_unicode_case_folds(self):
+        # dotted capital I matches (?i)[A-Z] and must hit the same rule
+        fragment = u'Function İnit:Int()\n'
+        tokens = list(MonkeyLexer().get_tokens(fragment))
+        self.assertTrue((Token.Name.Function, u'İnit') in tokens,
+                        tokens)
+
+    def test_unicode_case_folds_blitz(self):
+        # the explicit case-folded classes must keep accepting the
+        # Unicode fold partners that re.IGNORECASE accepted
+        tokens = list(BlitzMaxLexer().get_tokens(u'3.14ſ\n'))
+        self.assertTrue((Token.Name.Variable, u'ſ') in tokens, tokens)
+        tokens = list(BlitzMaxLexer().get_tokens(u'ſuperſtrict\n'))
+        self.assertTrue((Token.Keyword.Reserved, u'ſuperſtrict') in tokens,
+                        tokens)
+        tokens = list(BlitzBasicLexer().get_tokens(u'İf x\n'))
+        self.assertTrue((Token.Keyword.Reserved, u'İf') in tokens, tokens)
+
+    def test_keyword_with_type_sigil(self):
+        # $-suffixed builtins like Chr$ are idiomatic BlitzBasic; they
+        # deliberately take the variable-plus-type-sigil form (the old
+        # lexer produced Keyword.Reserved 'Chr' followed by Error '$')
+        fragment = u'x$ = Chr$(65)\n'
+        expected = [
+            (Token.Name.Variable, u'x'),
+            (Token.Keyword.Type, u'$'),
+            (Token.Text, u' '),
+            (Token.Operator, u'='),
+            (Token.Text, u' '),
+            (Token.Name.Variable, u'Chr'),
+            (Token.Keyword.Type, u'$'),
+            (Token.Punctuation, u'('),
+            (Token.Literal.Number.Integer, u'65'),
+            (Token.Punctuation, u')'),
+            (Token.Text, u'\n'),
+        ]
+        self.assertEqual(expected,
+                         list(BlitzBasicLexer().get_tokens(fragment)))
+
+    def test_large_texts_are_not_cached(self):
+        from pygments.lexers import basic
+        lx = BlitzBasicLexer()
+        text = u'x = 1\n' * (basic._token_cache_maxtext // 6 + 1)
+        before = len(basic._token_cache)
+        tokens = lx.get_tokens_unprocessed(text)
+        self.assertEqual(next(iter(tokens))[2], u'x')
+        self.assertEqual(len(basic._token_cache), before)
+
+    def test_bucket_cache_is_bounded(self):
+        lx = MonkeyLexer()
+        text = u''.join(chr(c) for c in range(0x100, 0x2000, 3)) + u'\n'
+        list(lx.get_tokens(text))
+        buckets = MonkeyLexer._dispatch_cache[1]
+        for statename, char in buckets:
+            self.assertTrue(ord(char) <= 0x80, repr(char))